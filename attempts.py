@@ -0,0 +1,307 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import db
+import grading
+import questions
+import stats
+
+logger = logging.getLogger(__name__)
+
+# async — запись в фоне, synchronous=NORMAL (быстро, при сбое питания
+#         можно потерять последние попытки)
+# full  — запись в фоне, synchronous=FULL
+# sync  — запись и commit прямо в запросе
+DURABILITY = os.environ.get('ATTEMPTS_DURABILITY', 'async')
+BATCH_SIZE = int(os.environ.get('ATTEMPTS_BATCH_SIZE', 256))
+QUEUE_SIZE = int(os.environ.get('ATTEMPTS_QUEUE_SIZE', 10000))
+# Сколько запрос ждет места в очереди, прежде чем записать попытку сам
+SUBMIT_TIMEOUT = float(os.environ.get('ATTEMPTS_SUBMIT_TIMEOUT', 5))
+# Сколько раз повторять пачку, если база занята дольше busy_timeout
+WRITE_RETRIES = 3
+# Попытки, которые не удалось записать даже по одной, сохраняются сюда
+FAILED_PATH = os.environ.get('ATTEMPTS_FAILED_PATH', 'attempts_failed.jsonl')
+PAGE_SIZE = 20
+REGRADE_BATCH_SIZE = 5000
+
+INSERT_SQL = '''
+    INSERT INTO attempts
+        (user_id, category, question_ids, answers, score, total, duration, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+_STOP = object()
+
+
+def create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            question_ids TEXT NOT NULL,
+            answers TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            duration REAL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS attempts_user_created
+        ON attempts (user_id, created_at)
+    ''')
+
+
+class AttemptWriter:
+    def __init__(self, path, durability):
+        self.path = path
+        self.durability = durability
+        self.pid = os.getpid()
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.stats = {'written': 0, 'batches': 0, 'failed': 0, 'restarts': 0, 'fallbacks': 0}
+        self.stopped = False
+        self._thread = None
+        self.start()
+
+    def start(self):
+        if self._thread is not None:
+            self.stats['restarts'] += 1
+        self._thread = threading.Thread(target=self._run, name='attempt-writer', daemon=True)
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def submit(self, row):
+        # Если очередь заполнена, запрос подождет — это и есть обратное давление.
+        # Не дождались места — возвращаем False, и запрос запишет попытку сам
+        if self.stopped:
+            return False
+        try:
+            self.queue.put(row, timeout=SUBMIT_TIMEOUT)
+        except queue.Full:
+            self.stats['fallbacks'] += 1
+            return False
+        return True
+
+    def flush(self):
+        self.queue.join()
+
+    def stop(self, timeout=10):
+        self.stopped = True
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            conn = db.connect(self.path)
+            if self.durability == 'full':
+                conn.execute('PRAGMA synchronous = FULL')
+            stopping = False
+            while not stopping:
+                batch = [self.queue.get()]
+                try:
+                    # Забираем все, что успело накопиться, одной транзакцией
+                    while len(batch) < BATCH_SIZE:
+                        try:
+                            batch.append(self.queue.get_nowait())
+                        except queue.Empty:
+                            break
+                    if _STOP in batch:
+                        stopping = True
+                    rows = [row for row in batch if row is not _STOP]
+                    if rows:
+                        self._write(conn, rows)
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+            conn.close()
+        except Exception:
+            # get_writer() увидит, что поток остановился, и запустит новый
+            logger.exception('Поток записи попыток остановился')
+
+    def _write(self, conn, rows):
+        # Пользователю уже ответили, что попытка сохранена, поэтому не теряем
+        # строки: повторяем пачку, затем пишем по одной, а оставшиеся
+        # откладываем в FAILED_PATH
+        for retry in range(WRITE_RETRIES):
+            try:
+                with conn:
+                    conn.executemany(INSERT_SQL, rows)
+            except sqlite3.OperationalError:
+                logger.warning('База занята, повторяем запись %d попыток', len(rows))
+                time.sleep(0.1 * 2 ** retry)
+            except Exception:
+                break
+            else:
+                self.stats['written'] += len(rows)
+                self.stats['batches'] += 1
+                self._refresh_stats(conn)
+                return
+        failed = []
+        for row in rows:
+            try:
+                with conn:
+                    conn.execute(INSERT_SQL, row)
+            except Exception:
+                failed.append(row)
+            else:
+                self.stats['written'] += 1
+        if failed:
+            self.stats['failed'] += len(failed)
+            self._save_failed(failed)
+        if len(failed) < len(rows):
+            self._refresh_stats(conn)
+
+    def _save_failed(self, rows):
+        try:
+            with open(FAILED_PATH, 'a', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False) + '\n')
+        except OSError:
+            logger.exception('Потеряно %d попыток: не удалось записать %s', len(rows), FAILED_PATH)
+        else:
+            logger.error('Не удалось сохранить %d попыток, они отложены в %s', len(rows), FAILED_PATH)
+
+    def _refresh_stats(self, conn):
+        # Сразу досчитываем рейтинг и статистику по вопросам
+        try:
+            stats.get_aggregates().refresh(conn)
+        except Exception:
+            logger.exception('Не удалось обновить статистику')
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    if _writer is None or _writer.pid != os.getpid() or not (_writer.is_alive() or _writer.stopped):
+        with _writer_lock:
+            if _writer is None or _writer.pid != os.getpid():
+                _writer = AttemptWriter(db.DATABASE, DURABILITY)
+            elif not _writer.is_alive() and not _writer.stopped:
+                # Поток упал — запускаем новый, очередь остается прежней
+                _writer.start()
+    return _writer
+
+
+@atexit.register
+def shutdown():
+    if _writer is not None and _writer.pid == os.getpid():
+        _writer.stop()
+
+
+def record(user_id, category, question_ids, answers, score, total, duration):
+    row = (
+        user_id,
+        category,
+        json.dumps(question_ids),
+        json.dumps(answers, ensure_ascii=False),
+        score,
+        total,
+        duration,
+        time.time(),
+    )
+    if DURABILITY == 'sync' or not get_writer().submit(row):
+        conn = db.get_db()
+        conn.execute(INSERT_SQL, row)
+        conn.commit()
+
+
+def parse_cursor(value):
+    # Курсор страницы: "<created_at>:<id>" последней показанной попытки
+    try:
+        created_at, attempt_id = value.split(':')
+        return float(created_at), int(attempt_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_history(conn, user_id, before=None, limit=PAGE_SIZE):
+    if before is None:
+        rows = conn.execute('''
+            SELECT id, category, score, total, duration, created_at FROM attempts
+            WHERE user_id = ?
+            ORDER BY created_at DESC, id DESC LIMIT ?
+        ''', (user_id, limit + 1)).fetchall()
+    else:
+        rows = conn.execute('''
+            SELECT id, category, score, total, duration, created_at FROM attempts
+            WHERE user_id = ? AND (created_at, id) < (?, ?)
+            ORDER BY created_at DESC, id DESC LIMIT ?
+        ''', (user_id, before[0], before[1], limit + 1)).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = '%r:%d' % (last['created_at'], last['id'])
+    return rows, next_cursor
+
+
+def replay_failed(path=FAILED_PATH):
+    # Дописываем в базу попытки, отложенные писателем, и убираем файл
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding='utf-8') as f:
+        rows = [tuple(json.loads(line)) for line in f if line.strip()]
+    conn = db.connect()
+    try:
+        with conn:
+            conn.executemany(INSERT_SQL, rows)
+        stats.get_aggregates().refresh(conn)
+    finally:
+        conn.close()
+    os.remove(path)
+    return len(rows)
+
+
+def regrade(category=None, batch_size=REGRADE_BATCH_SIZE):
+    # Пересчет баллов старых попыток по текущему ключу ответов, например
+    # после исправления ошибки в вопросах. Читаем попытки порциями по id,
+    # а измененные баллы обновляем одной транзакцией на порцию
+    result = {'checked': 0, 'changed': 0, 'skipped': 0}
+    conn = db.connect()
+    try:
+        last_id = 0
+        while True:
+            rows = conn.execute('''
+                SELECT id, category, answers, score, total FROM attempts
+                WHERE id > ? AND (? IS NULL OR category = ?)
+                ORDER BY id LIMIT ?
+            ''', (last_id, category, category, batch_size)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            by_category = {}
+            for row in rows:
+                by_category.setdefault(row['category'], []).append(row)
+            updates = []
+            for name, group in by_category.items():
+                bank = questions.get_bank(name)
+                if bank is None:
+                    result['skipped'] += len(group)
+                    continue
+                graded = grading.grade_many(bank.key, [json.loads(row['answers']) for row in group])
+                for row, (score, total) in zip(group, graded):
+                    if score != row['score'] or total != row['total']:
+                        updates.append((score, total, row['id']))
+                result['checked'] += len(group)
+            if updates:
+                with conn:
+                    conn.executemany('UPDATE attempts SET score = ?, total = ? WHERE id = ?', updates)
+                result['changed'] += len(updates)
+        # Рейтинг и статистика по вопросам тоже считаются по ключу — собираем заново
+        stats.rebuild(conn)
+    finally:
+        conn.close()
+    return result
@@ -0,0 +1,134 @@
+"""Бенчмарк слоя SQLite: новое соединение на каждый запрос против пула с WAL.
+
+    python bench_db.py
+    python bench_db.py --threads 8 --queries 20000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from loadtest import percentile
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL
+    )
+'''
+
+
+class Direct:
+    # Как было раньше: sqlite3.connect на каждый запрос, журнал по умолчанию
+    name = 'connect'
+
+    def __init__(self, path):
+        self.path = path
+        conn = sqlite3.connect(path)
+        conn.execute(SCHEMA)
+        conn.commit()
+        conn.close()
+
+    def read(self, username):
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+        finally:
+            conn.close()
+
+    def write(self, username):
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute('INSERT INTO users (username, password) VALUES (?, ?)', (username, 'x'))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class Pooled:
+    name = 'pool'
+
+    def __init__(self, path):
+        import db
+        self.pool = db.ConnectionPool(path, db.POOL_SIZE)
+        conn = self.pool.acquire()
+        conn.execute(SCHEMA)
+        conn.commit()
+        self.pool.release(conn)
+
+    def read(self, username):
+        conn = self.pool.acquire()
+        try:
+            return conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+        finally:
+            self.pool.release(conn)
+
+    def write(self, username):
+        conn = self.pool.acquire()
+        try:
+            conn.execute('INSERT INTO users (username, password) VALUES (?, ?)', (username, 'x'))
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+
+
+def run(layer, operation, count, threads):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(count))
+
+    def worker():
+        local = []
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            start = time.perf_counter()
+            try:
+                getattr(layer, operation)('%s_%d' % (operation, i))
+            except sqlite3.OperationalError:
+                # "database is locked"
+                with lock:
+                    errors[0] += 1
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return len(latencies), errors[0], wall, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=5000, help='чтений по имени пользователя')
+    parser.add_argument('--writes', type=int, default=1000, help='регистраций, каждая в своей транзакции')
+    parser.add_argument('--threads', type=int, default=4, help='одновременных потоков')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    print('%-8s %-6s %7s %6s %9s %8s %8s' % ('layer', 'op', 'count', 'errors', 'ops/s', 'p50 ms', 'p99 ms'))
+    for layer_class in (Direct, Pooled):
+        layer = layer_class(os.path.join(directory, '%s.db' % layer_class.name))
+        for operation, count in (('write', args.writes), ('read', args.queries)):
+            done, errors, wall, latencies = run(layer, operation, count, args.threads)
+            print('%-8s %-6s %7d %6d %9.1f %8.3f %8.3f' % (
+                layer.name, operation, done, errors, done / wall,
+                percentile(latencies, 0.50) * 1000,
+                percentile(latencies, 0.99) * 1000,
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Бенчмарк проверки ответов: проход по всему ключу против grading.grade().
+
+    python bench_grading.py
+    python bench_grading.py --sizes 100 10000 1000000 --answered 15
+"""
+import argparse
+import random
+import time
+
+import grading
+
+
+def full_scan(answer_key, form):
+    # Прежний test_python_submit(): обходим весь ключ и ищем каждый id в форме
+    score = 0
+    answered = 0
+    for question_id, correct in answer_key:
+        value = form.get(str(question_id))
+        if value is not None:
+            answered += 1
+            try:
+                if int(value) == correct:
+                    score += 1
+            except Exception:
+                pass
+    return score, answered
+
+
+def per_call(fn, min_time):
+    # Повторяем, пока не наберется min_time секунд, чтобы большие банки не шли вечно
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10000, 1000000], help='размеры банка вопросов')
+    parser.add_argument('--answered', type=int, default=15, help='ответов в одной попытке')
+    parser.add_argument('--batch', type=int, default=10000, help='попыток в одном вызове grade_many')
+    parser.add_argument('--min-time', type=float, default=0.5, help='минимальное время замера, секунд')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print('%10s %-12s %14s' % ('questions', 'method', 'us/attempt'))
+    for size in args.sizes:
+        answers = {question_id: rng.randrange(4) for question_id in range(1, size + 1)}
+        answer_key = sorted(answers.items())
+        key = grading.AnswerKey(answers)
+        submissions = [
+            {str(question_id): str(rng.randrange(4)) for question_id in rng.sample(range(1, size + 1), min(args.answered, size))}
+            for _ in range(args.batch)
+        ]
+        form = submissions[0]
+        assert full_scan(answer_key, form) == grading.grade(key, form)
+
+        for method, fn, attempts in (
+            ('full scan', lambda: full_scan(answer_key, form), 1),
+            ('grade', lambda: grading.grade(key, form), 1),
+            ('grade_many', lambda: grading.grade_many(key, submissions), len(submissions)),
+        ):
+            print('%10d %-12s %14.3f' % (size, method, per_call(fn, args.min_time) / attempts * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Бенчмарк массового импорта пользователей из CSV.
+
+    python bench_import.py
+    python bench_import.py --sizes 1000 100000 1000000 --method pbkdf2:sha256:1000
+"""
+import argparse
+import csv
+import io
+import os
+import tempfile
+import time
+
+
+def make_csv(path, size, prefix):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(('username', 'password'))
+        for i in range(size):
+            writer.writerow(('%s_%d' % (prefix, i), 'password%d' % i))
+
+
+def one_by_one(path, method):
+    # Как /register: хеш, INSERT и commit на каждого пользователя
+    import db
+    from werkzeug.security import generate_password_hash
+    conn = db.connect()
+    try:
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = csv.reader(f)
+            next(rows)
+            for username, password in rows:
+                conn.execute(
+                    'INSERT INTO users (username, password) VALUES (?, ?)',
+                    (username, generate_password_hash(password, method=method))
+                )
+                conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help='пользователей в CSV')
+    parser.add_argument('--method', default=None, help='метод хеширования; по умолчанию PASSWORD_HASH_METHOD')
+    parser.add_argument('--processes', type=int, default=None, help='процессов для хеширования')
+    parser.add_argument('--batch-size', type=int, default=None, help='пользователей в одной транзакции')
+    parser.add_argument('--baseline-max', type=int, default=1000, help='до какого размера мерить поштучную вставку')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    # Отдельная база, чтобы не засорять users.db
+    os.environ.setdefault('DATABASE', os.path.join(directory, 'bench_import.db'))
+    import hashing
+    import users
+    from app import init_db
+    init_db()
+    method = args.method or hashing.HASH_METHOD
+    batch_size = args.batch_size or users.IMPORT_BATCH_SIZE
+
+    print('method: %s' % method)
+    print('%-12s %9s %10s %10s' % ('mode', 'users', 'seconds', 'users/s'))
+    for number, size in enumerate(args.sizes):
+        if size <= args.baseline_max:
+            path = os.path.join(directory, 'single_%d.csv' % number)
+            make_csv(path, size, 'single%d' % number)
+            start = time.perf_counter()
+            one_by_one(path, method)
+            wall = time.perf_counter() - start
+            print('%-12s %9d %10.2f %10.1f' % ('one-by-one', size, wall, size / wall))
+
+        path = os.path.join(directory, 'import_%d.csv' % number)
+        make_csv(path, size, 'import%d' % number)
+        start = time.perf_counter()
+        with open(path, newline='', encoding='utf-8') as f:
+            result = users.import_csv(f, args.processes, batch_size, method)
+        wall = time.perf_counter() - start
+        assert result['imported'] == size, result
+        print('%-12s %9d %10.2f %10.1f' % ('import', size, wall, size / wall))
+
+    start = time.perf_counter()
+    exported = users.export_csv(io.StringIO())
+    wall = time.perf_counter() - start
+    print('%-12s %9d %10.2f %10.1f' % ('export', exported, wall, exported / wall))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Микробенчмарк банка вопросов: список словарей на каждый запрос против get_bank().
+
+    python bench_questions.py
+    python bench_questions.py --category python --calls 50000
+"""
+import argparse
+import json
+import os
+import random
+import time
+import tracemalloc
+
+import grading
+import questions
+
+
+def literal_questions(data):
+    # Так раньше делали test_python() и test_python_submit(): список из
+    # словарей собирался заново в каждом запросе
+    return [
+        {'id': q['id'], 'text': q['text'], 'options': list(q['options']), 'correct': q['correct']}
+        for q in data
+    ]
+
+
+def old_get(data):
+    all_questions = literal_questions(data)
+    selected = random.sample(all_questions, questions.TEST_SIZE)
+    selected.sort(key=lambda q: q['id'])
+    return selected
+
+
+def old_submit(data, form):
+    answer_key = [{'id': q['id'], 'correct': q['correct']} for q in literal_questions(data)]
+    score = 0
+    answered = 0
+    for q in answer_key:
+        value = form.get(str(q['id']))
+        if value is not None:
+            answered += 1
+            try:
+                if int(value) == q['correct']:
+                    score += 1
+            except Exception:
+                pass
+    return score, answered
+
+
+def new_get(category):
+    return questions.get_bank(category).sample(questions.new_seed())
+
+
+def new_submit(category, form, seed):
+    bank = questions.get_bank(category)
+    return grading.grade(bank.key, form, bank.sample_ids(seed))
+
+
+def measure(fn, calls):
+    fn()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--category', default='python', help='файл questions/<category>.json')
+    parser.add_argument('--calls', type=int, default=20000, help='вызовов на каждый вариант')
+    args = parser.parse_args()
+
+    with open(os.path.join(questions.QUESTIONS_DIR, args.category + '.json'), encoding='utf-8') as f:
+        data = json.load(f)
+    bank = questions.get_bank(args.category, strict=True)
+    seed = questions.new_seed()
+    # Пользователь ответил на все выданные вопросы
+    form = {str(q.id): str(q.correct) for q in bank.sample(seed)}
+
+    print('questions: %d' % len(bank))
+    print('%-14s %-6s %10s %12s' % ('route', 'store', 'us/call', 'peak alloc'))
+    for route, old, new in (
+        ('GET test', lambda: old_get(data), lambda: new_get(args.category)),
+        ('POST submit', lambda: old_submit(data, form), lambda: new_submit(args.category, form, seed)),
+    ):
+        for store, fn in (('list', old), ('bank', new)):
+            seconds, peak = measure(fn, args.calls)
+            print('%-14s %-6s %10.2f %9d KB' % (route, store, seconds * 1e6, peak // 1024))
+
+
+if __name__ == '__main__':
+    main()
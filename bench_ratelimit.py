@@ -0,0 +1,60 @@
+"""Бенчмарк ограничения входа: CPU на отклоненную попытку при росте числа ключей.
+
+    python bench_ratelimit.py
+    python bench_ratelimit.py --backends memory sqlite --keys 1000 100000 --requests 20000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+
+def cpu_per_call(fn, calls):
+    start = time.process_time()
+    for i in range(calls):
+        fn(i)
+    return (time.process_time() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backends', nargs='+', default=['memory', 'sqlite'], help='хранилища счетчиков')
+    parser.add_argument('--keys', type=int, nargs='+', default=[1000, 10000, 100000], help='адресов атакующих в хранилище')
+    parser.add_argument('--requests', type=int, default=10000, help='отклоненных попыток на замер')
+    args = parser.parse_args()
+
+    import hashing
+    import ratelimit
+
+    directory = tempfile.mkdtemp()
+    rng = random.Random(0)
+    limit = ratelimit.Limit('1/3600')
+
+    # Эту работу лимит экономит на каждой отклоненной попытке
+    verify = cpu_per_call(lambda i: hashing.verify_password(hashing.DUMMY_HASH, 'guess'), 20)
+    print('verify_password: %.0f us CPU' % (verify * 1e6))
+    print('%-8s %9s %8s %12s %12s' % ('backend', 'keys', 'stored', 'hit us CPU', 'check us CPU'))
+    for name in args.backends:
+        for keys in args.keys:
+            if name == 'sqlite':
+                backend = ratelimit.SQLiteBackend(os.path.join(directory, 'rate_%d.db' % keys))
+            else:
+                backend = ratelimit.MemoryBackend()
+            limiter = ratelimit.RateLimiter(backend, {'ip': limit, 'user': limit})
+            # Каждый адрес уже потратил свою единственную попытку
+            for i in range(keys):
+                limiter.hit('ip', 'attacker%d' % i)
+            targets = ['attacker%d' % rng.randrange(keys) for _ in range(args.requests)]
+            hit = cpu_per_call(lambda i: limiter.hit('ip', targets[i]), args.requests)
+            check = cpu_per_call(lambda i: limiter.check('ip', targets[i]), args.requests)
+            assert limiter.stats['rejected'] == 2 * args.requests, limiter.stats
+            if name == 'memory':
+                stored = len(backend)
+            else:
+                stored = backend._conn().execute('SELECT count(*) FROM rate_limits').fetchone()[0]
+            print('%-8s %9d %8d %12.2f %12.2f' % (name, keys, stored, hit * 1e6, check * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Бенчмарк выборки вопросов по seed на банках до миллиона вопросов.
+
+    python bench_sampling.py
+    python bench_sampling.py --sizes 100 1000000 --topics 8 --difficulties 3
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import questions
+
+
+def make_bank(directory, size, topics, difficulties):
+    path = os.path.join(directory, 'bench_%d_%d.json' % (size, topics))
+    data = [
+        {
+            'id': question_id,
+            'text': '',
+            'options': [],
+            'correct': 0,
+            'topic': 'topic%d' % (question_id % topics) if topics > 1 else None,
+            'difficulty': question_id % difficulties if difficulties > 1 else None,
+        }
+        for question_id in range(1, size + 1)
+    ]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    return questions.QuestionBank('bench', path)
+
+
+def per_call(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10000, 1000000], help='размеры банка вопросов')
+    parser.add_argument('--topics', type=int, default=5, help='тем для стратифицированного банка')
+    parser.add_argument('--difficulties', type=int, default=3, help='уровней сложности')
+    parser.add_argument('--k', type=int, default=questions.TEST_SIZE, help='вопросов в тесте')
+    parser.add_argument('--calls', type=int, default=5000, help='вызовов на каждый вариант')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    print('%10s %7s %-12s %10s' % ('questions', 'strata', 'method', 'us/call'))
+    for size in args.sizes:
+        for topics, difficulties in ((1, 1), (args.topics, args.difficulties)):
+            bank = make_bank(directory, size, topics, difficulties)
+            population = list(bank.questions)
+            seed = questions.new_seed()
+            assert bank.sample_ids(seed, args.k) == bank.sample_ids(seed, args.k)
+            methods = [
+                ('sample', lambda: bank.sample(questions.new_seed(), args.k)),
+                ('sample_ids', lambda: bank.sample_ids(seed, args.k)),
+            ]
+            if topics == 1:
+                # Прежний test_python(): глобальный random и сортировка выбранного
+                methods.insert(0, ('random', lambda: sorted(random.sample(population, args.k), key=lambda q: q.id)))
+            for method, fn in methods:
+                print('%10d %7d %-12s %10.2f' % (size, len(bank.strata), method, per_call(fn, args.calls) * 1e6))
+            os.remove(bank.path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import make_response, request, session
+
+import db
+
+CACHE_SIZE = int(os.environ.get('RENDER_CACHE_SIZE', 1024))
+CACHE_TTL = float(os.environ.get('RENDER_CACHE_TTL', 300))
+# Как часто сверяться с поколениями кеша, которые увеличивают другие воркеры
+SYNC_INTERVAL = float(os.environ.get('RENDER_CACHE_SYNC_INTERVAL', 1))
+
+
+def create_tables(conn):
+    # Поколение кеша для каждого маршрута ('*' — все маршруты): у каждого
+    # воркера свой кеш, и сбросить его в других процессах можно только так
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_generations (
+            endpoint TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL
+        )
+    ''')
+
+
+class RenderCache:
+    # LRU с ограничением по времени жизни записи
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'not_modified': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+        self._generations = None
+        self._synced_at = 0.0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry
+            if entry is not None:
+                del self._entries[key]
+            self.stats['misses'] += 1
+            return None
+
+    def set(self, key, body, mimetype, ttl=None):
+        entry = (
+            time.monotonic() + (self.ttl if ttl is None else ttl),
+            body,
+            hashlib.sha1(body).hexdigest(),
+            int(time.time()),
+            mimetype,
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        return entry
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def invalidate(self, endpoint=None, value=None, conn=None):
+        # Удаляет страницы указанного маршрута и/или зависящие от значения
+        # из сессии, например от старого имени пользователя. С conn сброс
+        # маршрута целиком доходит и до остальных воркеров
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if (endpoint is None or key[0] == endpoint)
+                and (value is None or value in key[1])
+            ]
+            for key in keys:
+                del self._entries[key]
+            self.stats['invalidations'] += len(keys)
+        if conn is not None:
+            with conn:
+                conn.execute('''
+                    INSERT INTO cache_generations (endpoint, generation) VALUES (?, 1)
+                    ON CONFLICT (endpoint) DO UPDATE SET generation = generation + 1
+                ''', (endpoint or '*',))
+
+    def sync(self, conn):
+        now = time.monotonic()
+        if now - self._synced_at < SYNC_INTERVAL:
+            return
+        self._synced_at = now
+        generations = {
+            row['endpoint']: row['generation']
+            for row in conn.execute('SELECT endpoint, generation FROM cache_generations')
+        }
+        seen, self._generations = self._generations, generations
+        if seen is None:
+            return
+        for endpoint, generation in generations.items():
+            if seen.get(endpoint) != generation:
+                self.invalidate(None if endpoint == '*' else endpoint)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self):
+        with self._lock:
+            data = dict(self.stats)
+            data['size'] = len(self._entries)
+        return data
+
+
+render_cache = RenderCache(CACHE_SIZE, CACHE_TTL)
+
+
+def cached_page(vary=(), ttl=None):
+    # Кеширует GET-ответ страницы по маршруту и полям сессии из vary
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+            render_cache.sync(db.get_db())
+            key = (request.endpoint, tuple(session.get(name) for name in vary))
+            entry = render_cache.get(key)
+            if entry is None:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+                entry = render_cache.set(key, response.get_data(), response.mimetype, ttl)
+            _, body, etag, last_modified, mimetype = entry
+            response = make_response(body)
+            response.mimetype = mimetype
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.make_conditional(request)
+            if response.status_code == 304:
+                render_cache.count('not_modified')
+            return response
+        return decorated_function
+    return decorator
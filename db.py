@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import threading
+from queue import LifoQueue, Empty, Full
+
+from flask import g
+
+from metrics import InstrumentedConnection
+
+DATABASE = os.environ.get('DATABASE', 'users.db')
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+
+# Настройки SQLite: WAL позволяет читать во время записи,
+# busy_timeout ждет освобождения блокировки вместо "database is locked"
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),
+    ('mmap_size', 64 * 1024 * 1024),
+    ('busy_timeout', 5000),
+    ('temp_store', 'MEMORY'),
+)
+
+# Сколько подготовленных запросов держит каждое соединение
+STATEMENT_CACHE_SIZE = 256
+
+
+def connect(path=None):
+    conn = sqlite3.connect(
+        path or DATABASE,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        factory=InstrumentedConnection,
+    )
+    conn.row_factory = sqlite3.Row
+    for name, value in PRAGMAS:
+        conn.execute('PRAGMA %s = %s' % (name, value))
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.pid = os.getpid()
+        self._idle = LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self.stats = {
+            'created': 0,
+            'reused': 0,
+            'discarded': 0,
+            'in_use': 0,
+            'peak_in_use': 0,
+        }
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+            reused = True
+        except Empty:
+            conn = connect(self.path)
+            reused = False
+        with self._lock:
+            self.stats['reused' if reused else 'created'] += 1
+            self.stats['in_use'] += 1
+            if self.stats['in_use'] > self.stats['peak_in_use']:
+                self.stats['peak_in_use'] = self.stats['in_use']
+        return conn
+
+    def release(self, conn):
+        with self._lock:
+            self.stats['in_use'] -= 1
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except Full:
+            conn.close()
+            with self._lock:
+                self.stats['discarded'] += 1
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
+
+    def metrics(self):
+        with self._lock:
+            data = dict(self.stats)
+        data['idle'] = self._idle.qsize()
+        data['size'] = self.size
+        return data
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    # После fork (gunicorn --preload) соединения родителя использовать нельзя
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = ConnectionPool(DATABASE, POOL_SIZE)
+    return _pool
+
+
+def get_db():
+    if '_db' not in g:
+        g._db = get_pool().acquire()
+    return g._db
+
+
+def close_db(exc=None):
+    conn = g.pop('_db', None)
+    if conn is not None:
+        get_pool().release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
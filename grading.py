@@ -0,0 +1,96 @@
+from array import array
+
+NO_QUESTION = -1
+# До какого размера банка grade_many запоминает разобранные имена полей.
+# В банках больше этого номера вопросов почти не повторяются между попытками
+BATCH_KEY_SIZE = 65536
+
+
+class AnswerKey:
+    # Правильные ответы в плотном массиве: индекс — id вопроса,
+    # значение — номер правильного варианта или NO_QUESTION
+    __slots__ = ('correct',)
+
+    def __init__(self, answers):
+        size = max(answers) + 1 if answers else 0
+        self.correct = array('b', [NO_QUESTION]) * size
+        for question_id, correct in answers.items():
+            self.correct[question_id] = correct
+
+    def __len__(self):
+        return len(self.correct)
+
+
+def _answered(key, answers, served=None):
+    # Проходим только по присланным ответам, а не по всему банку вопросов.
+    # served — id выданных пользователю вопросов, остальные ответы не учитываем
+    correct = key.correct
+    size = len(correct)
+    for field, value in answers.items():
+        # isdigit() пропускает "²", который int() не разбирает
+        if not field.isdecimal():
+            continue
+        question_id = int(field)
+        if question_id >= size or str(question_id) != field:
+            continue
+        if served is not None and question_id not in served:
+            continue
+        expected = correct[question_id]
+        if expected != NO_QUESTION:
+            yield question_id, value, expected
+
+
+def grade(key, answers, served=None):
+    score = 0
+    answered = 0
+    for _, value, expected in _answered(key, answers, served):
+        answered += 1
+        try:
+            if int(value) == expected:
+                score += 1
+        except (TypeError, ValueError):
+            pass
+    return score, answered
+
+
+def submitted(key, answers, served=None):
+    # Ответы только на существующие вопросы: {id вопроса: выбранный вариант}
+    return {question_id: value for question_id, value, _ in _answered(key, answers, served)}
+
+
+def grade_many(key, submissions):
+    # Пакетная проверка, например пересчет старых попыток после исправления ключа.
+    # Одни и те же номера вопросов повторяются в тысячах попыток, поэтому имя
+    # поля разбирается и ищется в ключе один раз на пакет, а не в каждой попытке
+    correct = key.correct
+    size = len(correct)
+    if size > BATCH_KEY_SIZE:
+        return [grade(key, answers) for answers in submissions]
+    expected_for = {}
+    results = []
+    for answers in submissions:
+        score = 0
+        answered = 0
+        for field, value in answers.items():
+            expected = expected_for.get(field)
+            if expected is None:
+                expected = NO_QUESTION
+                if field.isdecimal():
+                    question_id = int(field)
+                    if question_id < size and str(question_id) == field:
+                        expected = correct[question_id]
+                expected_for[field] = expected
+            if expected == NO_QUESTION:
+                continue
+            answered += 1
+            try:
+                if int(value) == expected:
+                    score += 1
+            except (TypeError, ValueError):
+                pass
+        results.append((score, answered))
+    return results
+
+
+def percentage(score, answered):
+    return (score / answered) * 100 if answered > 0 else 0
@@ -0,0 +1,42 @@
+import multiprocessing
+import os
+
+bind = '0.0.0.0:%s' % os.environ.get('PORT', '8000')
+
+# gthread — несколько потоков в каждом процессе, чтобы медленный хеш пароля
+# или ожидание блокировки SQLite не останавливали весь сайт.
+# gevent тоже поддерживается (нужен пакет gevent), но sqlite3 и хеширование
+# в нем блокируют цикл событий, поэтому по умолчанию gthread
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+if worker_class == 'gevent':
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+
+# Вопросы и шаблоны загружаются один раз в мастер-процессе до fork
+preload_app = True
+timeout = 30
+graceful_timeout = 30
+accesslog = '-'
+
+
+def on_starting(server):
+    # Метрики прошлого запуска к новым процессам не относятся
+    import metrics
+    metrics.store.reset()
+
+
+def worker_exit(server, worker):
+    # Дописываем очередь попыток и сохраняем статистику перед выходом воркера
+    import attempts
+    import metrics
+    import stats
+    attempts.shutdown()
+    stats.shutdown()
+    metrics.store.flush()
+
+
+def child_exit(server, worker):
+    # Вызывается в мастере и для воркеров, убитых по таймауту
+    import metrics
+    metrics.store.mark_process_dead(worker.pid)
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from metrics import HASH_SECONDS
+
+# Метод и стоимость хеширования в формате werkzeug, например
+# "scrypt:32768:8:1" или "pbkdf2:sha256:600000"
+HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', os.cpu_count() or 1))
+# Сколько задач может ждать в очереди сверх занятых потоков
+HASH_QUEUE_SIZE = int(os.environ.get('HASH_QUEUE_SIZE', 16))
+RETRY_AFTER = 1
+
+
+class HashPoolBusy(Exception):
+    pass
+
+
+class HashPool:
+    # scrypt и pbkdf2 из hashlib отпускают GIL, поэтому потоков достаточно
+    def __init__(self, workers, queue_size):
+        self.pid = os.getpid()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='hash'
+        )
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self.stats = {
+            'pending': 0,
+            'completed': 0,
+            'rejected': 0,
+            'seconds_total': 0.0,
+            'seconds_max': 0.0,
+        }
+
+    def _run(self, fn, args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            HASH_SECONDS.observe(elapsed, fn.__name__)
+            with self._lock:
+                self.stats['pending'] -= 1
+                self.stats['completed'] += 1
+                self.stats['seconds_total'] += elapsed
+                if elapsed > self.stats['seconds_max']:
+                    self.stats['seconds_max'] = elapsed
+            self._slots.release()
+
+    def call(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.stats['rejected'] += 1
+            raise HashPoolBusy()
+        with self._lock:
+            self.stats['pending'] += 1
+        return self._executor.submit(self._run, fn, args).result()
+
+    def metrics(self):
+        with self._lock:
+            return dict(self.stats)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = HashPool(HASH_WORKERS, HASH_QUEUE_SIZE)
+    return _pool
+
+
+def _method_prefix(pwhash):
+    return pwhash.split('$', 1)[0]
+
+
+# Хеш для проверки пароля несуществующего пользователя: ответ занимает
+# столько же времени, и по нему нельзя понять, есть ли такое имя
+DUMMY_HASH = generate_password_hash('', method=HASH_METHOD)
+# werkzeug дополняет метод параметрами по умолчанию ("scrypt" -> "scrypt:32768:8:1"),
+# поэтому сравниваем с префиксом настоящего хеша
+CURRENT_PREFIX = _method_prefix(DUMMY_HASH)
+
+
+def hash_password(password):
+    return get_pool().call(generate_password_hash, password, HASH_METHOD)
+
+
+def verify_password(pwhash, password):
+    return get_pool().call(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    return _method_prefix(pwhash) != CURRENT_PREFIX
@@ -0,0 +1,153 @@
+"""Нагрузочный тест: регистрация -> вход -> тест -> отправка ответов.
+
+    python loadtest.py                          # приложение в этом же процессе
+    python loadtest.py --url http://127.0.0.1:8000
+
+Все виртуальные пользователи входят с одного адреса, поэтому для --url
+сервер нужно запускать с поднятым лимитом входа, например
+LOGIN_LIMIT_IP=1000000/1, иначе часть входов получит 429.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+import uuid
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, build_opener
+
+
+class NoRedirect(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(self.url + path, data=body) as response:
+                response.read()
+                return response.status
+        except HTTPError as e:
+            return e.code
+
+
+class LocalClient:
+    # Клиент Flask вместо настоящего сервера: меряем само приложение без сети
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        if method == 'POST':
+            return self.client.post(path, data=data).status_code
+        return self.client.get(path).status_code
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def call(self, client, method, path, data=None, expected=200):
+        # Ошибка — любой неожиданный ответ: например, редирект на /login
+        # после неудачного входа тоже считается ошибкой, а не быстрым ответом
+        start = time.perf_counter()
+        status = client.request(method, path, data)
+        elapsed = time.perf_counter() - start
+        route = '%s %s' % (method, path)
+        with self._lock:
+            self.latencies.setdefault(route, []).append(elapsed)
+            if status != expected:
+                self.errors[route] = self.errors.get(route, 0) + 1
+        return status
+
+
+def scenario(make_client, recorder, prefix, user_number, iterations):
+    client = make_client()
+    credentials = {
+        'username': '%s_%d' % (prefix, user_number),
+        'password': 'loadtest',
+    }
+    recorder.call(client, 'POST', '/register', dict(credentials, confirm_password='loadtest'), expected=302)
+    recorder.call(client, 'POST', '/login', credentials, expected=302)
+    recorder.call(client, 'GET', '/')
+    # Отвечаем на все вопросы: сервер засчитает только выданные
+    answers = {str(question_id): '0' for question_id in range(1, 101)}
+    for _ in range(iterations):
+        recorder.call(client, 'GET', '/test/python')
+        recorder.call(client, 'POST', '/test/python/submit', answers)
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def report(recorder, wall):
+    print('%-28s %7s %6s %9s %8s %8s %8s' % ('route', 'count', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+    total = 0
+    for route, values in sorted(recorder.latencies.items()):
+        values.sort()
+        total += len(values)
+        print('%-28s %7d %6d %9.1f %8.2f %8.2f %8.2f' % (
+            route, len(values), recorder.errors.get(route, 0), len(values) / wall,
+            percentile(values, 0.50) * 1000,
+            percentile(values, 0.95) * 1000,
+            percentile(values, 0.99) * 1000,
+        ))
+    print('total: %d requests in %.2f s, %.1f req/s' % (total, wall, total / wall))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='адрес запущенного сервера (с поднятым LOGIN_LIMIT_IP); без него приложение запускается в процессе')
+    parser.add_argument('--users', type=int, default=20, help='число виртуальных пользователей')
+    parser.add_argument('--concurrency', type=int, default=4, help='сколько пользователей работают одновременно')
+    parser.add_argument('--iterations', type=int, default=5, help='сколько тестов проходит каждый пользователь')
+    args = parser.parse_args()
+
+    if args.url:
+        def make_client():
+            return HttpClient(args.url)
+    else:
+        # Отдельная база, чтобы не засорять users.db
+        os.environ.setdefault('DATABASE', os.path.join(tempfile.mkdtemp(), 'loadtest.db'))
+        # Все виртуальные пользователи приходят с одного адреса
+        os.environ.setdefault('LOGIN_LIMIT_IP', '1000000/1')
+        from app import app, init_db
+        init_db()
+
+        def make_client():
+            return LocalClient(app)
+
+    recorder = Recorder()
+    prefix = 'load_' + uuid.uuid4().hex[:8]
+    next_user = iter(range(args.users))
+    next_user_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with next_user_lock:
+                user_number = next(next_user, None)
+            if user_number is None:
+                return
+            scenario(make_client, recorder, prefix, user_number, args.iterations)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(recorder, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
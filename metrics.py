@@ -0,0 +1,373 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import Response, g, request, before_render_template, template_rendered
+
+logger = logging.getLogger(__name__)
+
+# Общий файл, через который воркеры gunicorn складывают свои метрики
+METRICS_DATABASE = os.environ.get('METRICS_DATABASE', 'metrics.db')
+FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {key: [list(counts), total, count] for key, (counts, total, count) in self._values.items()}
+
+    @staticmethod
+    def merge(current, value):
+        if current is None:
+            return value
+        counts = [a + b for a, b in zip(current[0], value[0])]
+        return [counts, current[1] + value[1], current[2] + value[2]]
+
+    def format(self, values):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s histogram' % self.name]
+        for label_values, (counts, total, count) in sorted(values.items()):
+            labels = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append('%s_bucket%s %d' % (self.name, _labels(self.labels + ('le',), label_values + (repr(bound),)), cumulative))
+            lines.append('%s_bucket%s %d' % (self.name, _labels(self.labels + ('le',), label_values + ('+Inf',)), count))
+            lines.append('%s_sum%s %r' % (self.name, labels, total))
+            lines.append('%s_count%s %d' % (self.name, labels, count))
+        return lines
+
+
+class CounterMetric:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values):
+        with self._lock:
+            self._values[label_values] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(current, value):
+        return value if current is None else current + value
+
+    def format(self, values):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s counter' % self.name]
+        for label_values, value in sorted(values.items()):
+            lines.append('%s%s %d' % (self.name, _labels(self.labels, label_values), value))
+        return lines
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in zip(names, values))
+    return '{%s}' % ','.join(pairs)
+
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Время обработки запроса', ('endpoint', 'method'))
+REQUESTS = CounterMetric('http_requests_total', 'Число запросов', ('endpoint', 'status'))
+QUERY_SECONDS = Histogram('sqlite_query_duration_seconds', 'Время выполнения запросов SQLite', ('statement',))
+TEMPLATE_SECONDS = Histogram('template_render_duration_seconds', 'Время отрисовки шаблона', ('template',))
+HASH_SECONDS = Histogram('password_hash_duration_seconds', 'Время хеширования и проверки пароля', ('operation',))
+METRICS = {
+    metric.name: metric
+    for metric in (REQUEST_SECONDS, REQUESTS, QUERY_SECONDS, TEMPLATE_SECONDS, HASH_SECONDS)
+}
+
+# Функции, которые при выдаче /metrics возвращают текущие значения:
+# {имя метрики: (описание, значение)}
+_gauges = []
+
+
+def register_gauges(fn):
+    _gauges.append(fn)
+    return fn
+
+
+def _statement(sql):
+    return sql.lstrip().split(None, 1)[0].upper() if sql.strip() else 'EMPTY'
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            QUERY_SECONDS.observe(time.perf_counter() - start, _statement(sql))
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            QUERY_SECONDS.observe(time.perf_counter() - start, _statement(sql))
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Connection.execute в C не проходит через cursor(), поэтому перехватываем и его
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class SlowRequestProfiler:
+    # Сэмплирующий профайлер: пока идут запросы, раз в interval снимает стеки
+    # их потоков; стеки медленных запросов сохраняются в формате
+    # "func;func;func count", который понимают flamegraph.pl и speedscope
+    def __init__(self, interval, threshold, directory):
+        self.interval = interval
+        self.threshold = threshold
+        self.directory = directory
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start_request(self):
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+                self._thread.start()
+
+    def end_request(self, endpoint, elapsed):
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if not samples or elapsed < self.threshold:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory,
+            '%s-%d-%d.folded' % (endpoint, os.getpid(), time.time() * 1000),
+        )
+        with open(path, 'w') as f:
+            for stack, count in samples.items():
+                f.write('%s %d\n' % (stack, count))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, samples in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[_collapse(frame)] += 1
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append('%s:%s:%d' % (os.path.basename(code.co_filename), code.co_name, frame.f_lineno))
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+profiler = None
+if os.environ.get('PROFILE_SLOW_REQUESTS'):
+    profiler = SlowRequestProfiler(
+        float(os.environ.get('PROFILE_INTERVAL_MS', 5)) / 1000,
+        float(os.environ.get('PROFILE_THRESHOLD_MS', 500)) / 1000,
+        os.environ.get('PROFILE_DIR', 'profiles'),
+    )
+
+
+def _before_request():
+    g._request_started = time.perf_counter()
+    store.start_flusher()
+    if profiler is not None:
+        profiler.start_request()
+
+
+def _after_request(response):
+    REQUESTS.inc(request.endpoint or 'unknown', response.status_code)
+    return response
+
+
+def _teardown_request(exc=None):
+    started = g.pop('_request_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or 'unknown'
+    REQUEST_SECONDS.observe(elapsed, endpoint, request.method)
+    if profiler is not None:
+        profiler.end_request(endpoint, elapsed)
+
+
+def _before_render(sender, template, context, **extra):
+    g._render_started = time.perf_counter()
+
+
+def _rendered(sender, template, context, **extra):
+    started = g.pop('_render_started', None)
+    if started is not None:
+        TEMPLATE_SECONDS.observe(time.perf_counter() - started, template.name)
+
+
+class SharedStore:
+    # Каждый воркер пишет накопленные с запуска значения в общий SQLite-файл
+    # под своим pid, а /metrics суммирует счетчики и гистограммы по всем pid.
+    # Так значения не скачут в зависимости от того, какой воркер ответил,
+    # и не уменьшаются после выхода воркера. Gauge-метрики отдаются с меткой pid
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS metric_samples (
+                    pid INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    PRIMARY KEY (pid, name, labels)
+                )
+            ''')
+            conn.commit()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def flush(self):
+        pid = os.getpid()
+        rows = []
+        for metric in METRICS.values():
+            for label_values, value in metric.snapshot().items():
+                rows.append((pid, metric.name, json.dumps(label_values), metric.kind, json.dumps(value)))
+        for fn in _gauges:
+            for name, (help, value) in fn().items():
+                rows.append((pid, name, '[]', 'gauge', json.dumps([help, value])))
+        conn = self._conn()
+        with conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO metric_samples (pid, name, labels, kind, value)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+
+    def collect(self):
+        merged = {name: {} for name in METRICS}
+        gauges = {}
+        for pid, name, labels, kind, value in self._conn().execute(
+            'SELECT pid, name, labels, kind, value FROM metric_samples'
+        ):
+            value = json.loads(value)
+            if kind == 'gauge':
+                gauges.setdefault(name, (value[0], {}))[1][pid] = value[1]
+                continue
+            metric = METRICS.get(name)
+            if metric is None:
+                continue
+            key = tuple(json.loads(labels))
+            merged[name][key] = metric.merge(merged[name].get(key), value)
+        return merged, gauges
+
+    def mark_process_dead(self, pid):
+        # Счетчики вышедшего воркера остаются в сумме, а его gauge — нет
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM metric_samples WHERE pid = ? AND kind = 'gauge'", (pid,))
+
+    def reset(self):
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM metric_samples')
+
+    def start_flusher(self):
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid != os.getpid():
+                self._flusher_pid = os.getpid()
+                threading.Thread(target=self._run, name='metrics-flush', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось сохранить метрики')
+
+
+store = SharedStore(METRICS_DATABASE)
+
+
+def expose():
+    store.flush()
+    merged, gauges = store.collect()
+    lines = []
+    for name, metric in METRICS.items():
+        lines.extend(metric.format(merged[name]))
+    for name, (help, values) in sorted(gauges.items()):
+        lines.append('# HELP %s %s' % (name, help))
+        lines.append('# TYPE %s gauge' % name)
+        for pid, value in sorted(values.items()):
+            lines.append('%s{pid="%d"} %r' % (name, pid, value))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view():
+    return Response(expose(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from grading import AnswerKey
+
+logger = logging.getLogger(__name__)
+
+QUESTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'questions')
+
+# Как часто (в секундах) проверять, не изменился ли файл с вопросами
+RELOAD_INTERVAL = 2.0
+# Сколько вопросов попадает в один тест
+TEST_SIZE = 15
+
+
+class Question:
+    __slots__ = ('id', 'text', 'options', 'correct', 'topic', 'difficulty')
+
+    def __init__(self, id, text, options, correct, topic=None, difficulty=None):
+        self.id = id
+        self.text = text
+        self.options = tuple(options)
+        self.correct = correct
+        self.topic = topic
+        self.difficulty = difficulty
+
+    # Шаблоны обращаются к вопросу как к словарю: q['text']
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+
+class QuestionBank:
+    def __init__(self, category, path):
+        self.category = category
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        self.questions = tuple(sorted(
+            (
+                Question(
+                    q['id'], q['text'], q['options'], q['correct'],
+                    q.get('topic'), q.get('difficulty'),
+                )
+                for q in data
+            ),
+            key=lambda q: q.id,
+        ))
+        self.by_id = {q.id: q for q in self.questions}
+        # Индекс id -> номер правильного ответа, общий для показа и проверки
+        self.answers = {q.id: q.correct for q in self.questions}
+        self.key = AnswerKey(self.answers)
+        self.strata = self._build_strata()
+
+    def _build_strata(self):
+        # Группы вопросов по теме и сложности для пропорциональной выборки.
+        # Без разметки вся база — одна группа, и копия списка не нужна
+        groups = {}
+        for index, q in enumerate(self.questions):
+            groups.setdefault((q.topic, q.difficulty), []).append(index)
+        if len(groups) <= 1:
+            return (range(len(self.questions)),)
+        return tuple(tuple(indices) for _, indices in sorted(groups.items(), key=lambda item: repr(item[0])))
+
+    def __len__(self):
+        return len(self.questions)
+
+    def sample(self, seed, k=TEST_SIZE):
+        # Набор вопросов полностью определяется seed, поэтому при проверке
+        # его можно восстановить без хранения и без обращения к базе
+        k = min(k, len(self.questions))
+        rng = random.Random(seed)
+        picked = []
+        for indices, count in zip(self.strata, _allocate(self.strata, len(self.questions), k)):
+            if count:
+                picked.extend(rng.sample(indices, count))
+        picked.sort()
+        return [self.questions[index] for index in picked]
+
+    def sample_ids(self, seed, k=TEST_SIZE):
+        return {q.id for q in self.sample(seed, k)}
+
+
+def _allocate(strata, total, k):
+    # Метод наибольших остатков: каждой группе достается доля k по ее размеру
+    if total == 0:
+        return [0] * len(strata)
+    quotas = [len(indices) * k / total for indices in strata]
+    counts = [int(quota) for quota in quotas]
+    by_remainder = sorted(range(len(strata)), key=lambda i: quotas[i] - counts[i], reverse=True)
+    for i in by_remainder[:k - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def new_seed():
+    return random.SystemRandom().getrandbits(63)
+
+
+_banks = {}
+_checked = {}
+# mtime файлов, которые не удалось загрузить, чтобы не разбирать их на каждом запросе
+_failed = {}
+_lock = threading.Lock()
+
+
+def categories():
+    return sorted(
+        name[:-len('.json')] for name in os.listdir(QUESTIONS_DIR)
+        if name.endswith('.json')
+    )
+
+
+def get_bank(category, strict=False):
+    if not category.isidentifier():
+        return None
+    bank = _banks.get(category)
+    now = time.monotonic()
+    if bank is not None and now - _checked.get(category, 0) < RELOAD_INTERVAL:
+        return bank
+
+    path = os.path.join(QUESTIONS_DIR, category + '.json')
+    with _lock:
+        bank = _banks.get(category)
+        _checked[category] = now
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            # Файл удалили — продолжаем отдавать то, что уже загружено
+            return bank
+        if bank is not None and bank.mtime == mtime:
+            return bank
+        if not strict and _failed.get(category) == mtime:
+            return bank
+        try:
+            bank = QuestionBank(category, path)
+        except (OSError, ValueError, KeyError, TypeError):
+            # При запуске битый файл — ошибка; при горячей перезагрузке
+            # (например, файл записан не до конца) оставляем прежний банк
+            if strict:
+                raise
+            _failed[category] = mtime
+            logger.exception('Не удалось загрузить вопросы из %s', path)
+            return _banks.get(category)
+        _failed.pop(category, None)
+        _banks[category] = bank
+    return bank
+
+
+def load_all():
+    for category in categories():
+        get_bank(category, strict=True)
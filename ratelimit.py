@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+
+import db
+
+# Лимиты в формате "попыток/секунд". ip_user — неверные пароли для пары
+# (IP, имя пользователя); user — неверные пароли к имени с любых адресов,
+# он выше, чтобы чужие попытки не сразу блокировали вход владельцу
+LOGIN_LIMIT_IP = os.environ.get('LOGIN_LIMIT_IP', '20/60')
+LOGIN_LIMIT_IP_USER = os.environ.get('LOGIN_LIMIT_IP_USER', '5/60')
+LOGIN_LIMIT_USER = os.environ.get('LOGIN_LIMIT_USER', '30/300')
+# memory — у каждого воркера свои счетчики; sqlite — общие для всех воркеров
+BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100000))
+SWEEP_INTERVAL = 60.0
+
+
+class Limit:
+    __slots__ = ('capacity', 'rate', 'ttl')
+
+    def __init__(self, spec):
+        count, period = spec.split('/')
+        self.capacity = float(count)
+        self.rate = self.capacity / float(period)
+        # Через ttl секунд ведро снова полное, и запись можно забыть
+        self.ttl = float(period)
+
+
+def _take(tokens, updated, now, limit):
+    # Ведро токенов: пополняется со скоростью rate, каждая попытка тратит один токен
+    tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / limit.rate
+
+
+def _peek(tokens, updated, now, limit):
+    # То же, что _take, но без списания токена
+    tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+    return 0 if tokens >= 1 else (1 - tokens) / limit.rate
+
+
+class MemoryBackend:
+    def __init__(self, max_keys=MAX_KEYS):
+        self.max_keys = max_keys
+        # ключ -> (токены, время обновления, время истечения)
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._swept_at = time.monotonic()
+
+    def take(self, key, limit):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens, updated = limit.capacity, now
+            else:
+                tokens, updated, _ = bucket
+            tokens, retry_after = _take(tokens, updated, now, limit)
+            self._buckets[key] = (tokens, now, now + limit.ttl)
+            if len(self._buckets) > self.max_keys or now - self._swept_at >= SWEEP_INTERVAL:
+                self._sweep(now)
+        return retry_after
+
+    def peek(self, key, limit):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+        if bucket is None:
+            return 0
+        return _peek(bucket[0], bucket[1], now, limit)
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def _sweep(self, now):
+        self._swept_at = now
+        expired = [key for key, bucket in self._buckets.items() if bucket[2] <= now]
+        for key in expired:
+            del self._buckets[key]
+        # Под атакой со случайными именами память все равно ограничена:
+        # выбрасываем самые старые ключи
+        overflow = len(self._buckets) - self.max_keys
+        if overflow > 0:
+            for key in list(self._buckets)[:overflow + self.max_keys // 10]:
+                del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteBackend:
+    def __init__(self, path=None):
+        self.path = path
+        self._local = threading.local()
+        self._swept_at = time.time()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = db.connect(self.path)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    expires REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            conn.commit()
+        return conn
+
+    def take(self, key, limit):
+        # Время берем настенное: счетчики общие для нескольких процессов
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT tokens, updated FROM rate_limits WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                tokens, updated = limit.capacity, now
+            else:
+                tokens, updated = row['tokens'], row['updated']
+            tokens, retry_after = _take(tokens, updated, now, limit)
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_limits (key, tokens, updated, expires) VALUES (?, ?, ?, ?)',
+                (key, tokens, now, now + limit.ttl)
+            )
+            if now - self._swept_at >= SWEEP_INTERVAL:
+                self._swept_at = now
+                conn.execute('DELETE FROM rate_limits WHERE expires <= ?', (now,))
+        return retry_after
+
+    def peek(self, key, limit):
+        now = time.time()
+        row = self._conn().execute(
+            'SELECT tokens, updated FROM rate_limits WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return 0
+        return _peek(row['tokens'], row['updated'], now, limit)
+
+    def reset(self, key):
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM rate_limits WHERE key = ?', (key,))
+
+
+class RateLimiter:
+    def __init__(self, backend, limits):
+        self.backend = backend
+        self.limits = limits
+        self.stats = {'allowed': 0, 'rejected': 0}
+
+    def hit(self, name, value):
+        # Возвращает 0, если попытка разрешена, иначе — через сколько секунд повторить
+        retry_after = self.backend.take('%s:%s' % (name, value), self.limits[name])
+        self.stats['rejected' if retry_after else 'allowed'] += 1
+        return retry_after
+
+    def check(self, name, value):
+        # Как hit, но попытка не списывается: ее списывают отдельно, например
+        # только после неверного пароля
+        retry_after = self.backend.peek('%s:%s' % (name, value), self.limits[name])
+        if retry_after:
+            self.stats['rejected'] += 1
+        return retry_after
+
+    def reset(self, name, value):
+        self.backend.reset('%s:%s' % (name, value))
+
+
+def create_backend(name=BACKEND):
+    if name == 'sqlite':
+        return SQLiteBackend(os.environ.get('RATE_LIMIT_DATABASE'))
+    return MemoryBackend()
+
+
+login_limiter = RateLimiter(create_backend(), {
+    'ip': Limit(LOGIN_LIMIT_IP),
+    'ip_user': Limit(LOGIN_LIMIT_IP_USER),
+    'user': Limit(LOGIN_LIMIT_USER),
+})
@@ -0,0 +1,314 @@
+import atexit
+import bisect
+import heapq
+import json
+import os
+import threading
+import time
+from array import array
+
+import db
+import questions
+from grading import NO_QUESTION
+
+TOP_K = int(os.environ.get('LEADERBOARD_SIZE', 10))
+# Как часто подхватывать попытки, записанные другими воркерами
+REFRESH_INTERVAL = 1.0
+CHECKPOINT_INTERVAL = 60.0
+
+
+def create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stats_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stats_users (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            points INTEGER NOT NULL,
+            answered_mask TEXT NOT NULL,
+            correct_mask TEXT NOT NULL,
+            PRIMARY KEY (user_id, category)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stats_questions (
+            category TEXT NOT NULL,
+            question_id INTEGER NOT NULL,
+            answered INTEGER NOT NULL,
+            correct INTEGER NOT NULL,
+            PRIMARY KEY (category, question_id)
+        )
+    ''')
+
+
+def _choice(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _grow(counts, size):
+    if len(counts) < size:
+        counts.extend(array('l', [0]) * (size - len(counts)))
+
+
+class CategoryStats:
+    # Сколько пользователей отвечали на вопрос и сколько из них ответили верно.
+    # Для каждого пользователя храним битовые маски вопросов, чтобы считать
+    # человека один раз, сколько бы попыток он ни сделал
+    __slots__ = ('answered', 'correct', 'masks', 'points')
+
+    def __init__(self):
+        self.answered = array('l')
+        self.correct = array('l')
+        self.masks = {}
+        self.points = {}
+
+    def percentages(self):
+        return [
+            (question_id, self.correct[question_id] * 100 / answered if question_id < len(self.correct) else 0)
+            for question_id, answered in enumerate(self.answered)
+            if answered
+        ]
+
+    def apply(self, user_id, results):
+        answered_mask, correct_mask = self.masks.get(user_id, (0, 0))
+        for question_id, is_correct in results:
+            bit = 1 << question_id
+            if not answered_mask & bit:
+                answered_mask |= bit
+                _grow(self.answered, question_id + 1)
+                self.answered[question_id] += 1
+            if is_correct and not correct_mask & bit:
+                correct_mask |= bit
+                _grow(self.correct, question_id + 1)
+                self.correct[question_id] += 1
+        self.masks[user_id] = (answered_mask, correct_mask)
+        score = sum(1 for _, is_correct in results if is_correct)
+        self.points[user_id] = self.points.get(user_id, 0) + score
+        return score
+
+
+class Aggregates:
+    def __init__(self):
+        self.pid = os.getpid()
+        self._reset()
+        self.refreshed_at = 0.0
+        self.checkpointed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reset(self):
+        # Поколение статистики: rebuild() увеличивает его, и воркеры со старыми
+        # счетчиками перечитывают состояние вместо того, чтобы его перезаписать
+        self.generation = 0
+        self.last_attempt_id = 0
+        self.categories = {}
+        self.points = {}
+        # Топ-K в виде отсортированного списка (-очки, user_id)
+        self.top = []
+        self.dirty = set()
+
+    def _category(self, category):
+        stats = self.categories.get(category)
+        if stats is None:
+            stats = self.categories[category] = CategoryStats()
+        return stats
+
+    def _update_top(self, user_id, points):
+        # Очки только растут, поэтому достаточно переставить одного пользователя
+        top = self.top
+        for i, (_, top_user) in enumerate(top):
+            if top_user == user_id:
+                del top[i]
+                break
+        entry = (-points, user_id)
+        if len(top) < TOP_K or entry < top[-1]:
+            bisect.insort(top, entry)
+            del top[TOP_K:]
+
+    def _apply(self, attempt_id, user_id, category, answers):
+        bank = questions.get_bank(category)
+        if bank is not None:
+            correct = bank.key.correct
+            results = []
+            for question_id, value in answers.items():
+                question_id = int(question_id)
+                if question_id < len(correct) and correct[question_id] != NO_QUESTION:
+                    results.append((question_id, _choice(value) == correct[question_id]))
+            score = self._category(category).apply(user_id, results)
+            if score:
+                points = self.points.get(user_id, 0) + score
+                self.points[user_id] = points
+                self._update_top(user_id, points)
+            self.dirty.add((user_id, category))
+        self.last_attempt_id = attempt_id
+
+    def load(self, conn):
+        # Поднимаем последнюю контрольную точку и досчитываем попытки после нее
+        with self._lock:
+            self._load(conn)
+        self.refresh(conn)
+
+    def _load(self, conn):
+        self._reset()
+        self.generation = _generation(conn)
+        stored = conn.execute(
+            "SELECT value FROM stats_meta WHERE key = 'last_attempt_id'"
+        ).fetchone()
+        if stored is not None:
+            self.last_attempt_id = stored['value']
+            for row in conn.execute('SELECT * FROM stats_users'):
+                stats = self._category(row['category'])
+                stats.masks[row['user_id']] = (
+                    int(row['answered_mask'], 16), int(row['correct_mask'], 16),
+                )
+                stats.points[row['user_id']] = row['points']
+                self.points[row['user_id']] = self.points.get(row['user_id'], 0) + row['points']
+            for row in conn.execute('SELECT * FROM stats_questions'):
+                stats = self._category(row['category'])
+                _grow(stats.answered, row['question_id'] + 1)
+                _grow(stats.correct, row['question_id'] + 1)
+                stats.answered[row['question_id']] = row['answered']
+                stats.correct[row['question_id']] = row['correct']
+            self.top = heapq.nsmallest(TOP_K, ((-points, user_id) for user_id, points in self.points.items()))
+
+    def refresh(self, conn):
+        # Досчитываем только попытки, появившиеся после последнего обновления
+        with self._lock:
+            if _generation(conn) != self.generation:
+                self._load(conn)
+            rows = conn.execute('''
+                SELECT id, user_id, category, answers FROM attempts
+                WHERE id > ? ORDER BY id
+            ''', (self.last_attempt_id,)).fetchall()
+            for row in rows:
+                self._apply(row['id'], row['user_id'], row['category'], json.loads(row['answers']))
+            self.refreshed_at = time.monotonic()
+            if self.refreshed_at - self.checkpointed_at >= CHECKPOINT_INTERVAL:
+                self._checkpoint(conn)
+
+    def refresh_if_stale(self, conn):
+        if time.monotonic() - self.refreshed_at >= REFRESH_INTERVAL:
+            self.refresh(conn)
+
+    def checkpoint(self, conn):
+        with self._lock:
+            self._checkpoint(conn)
+
+    def _checkpoint(self, conn):
+        self.checkpointed_at = time.monotonic()
+        if not self.dirty:
+            return
+        dirty, self.dirty = self.dirty, set()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            stored = conn.execute(
+                "SELECT value FROM stats_meta WHERE key = 'last_attempt_id'"
+            ).fetchone()
+            # Другой воркер уже сохранил состояние не старше нашего
+            if stored is not None and stored['value'] >= self.last_attempt_id:
+                return
+            # Статистику пересобрали — наши счетчики устарели, перечитаем их
+            # при следующем refresh
+            if _generation(conn) != self.generation:
+                return
+            user_rows = []
+            for user_id, category in dirty:
+                stats = self.categories[category]
+                answered_mask, correct_mask = stats.masks[user_id]
+                user_rows.append((
+                    user_id, category, stats.points[user_id],
+                    format(answered_mask, 'x'), format(correct_mask, 'x'),
+                ))
+            conn.executemany('''
+                INSERT OR REPLACE INTO stats_users
+                    (user_id, category, points, answered_mask, correct_mask)
+                VALUES (?, ?, ?, ?, ?)
+            ''', user_rows)
+            question_rows = []
+            for category, stats in self.categories.items():
+                for question_id, answered in enumerate(stats.answered):
+                    if answered:
+                        correct = stats.correct[question_id] if question_id < len(stats.correct) else 0
+                        question_rows.append((category, question_id, answered, correct))
+            conn.executemany('''
+                INSERT OR REPLACE INTO stats_questions (category, question_id, answered, correct)
+                VALUES (?, ?, ?, ?)
+            ''', question_rows)
+            conn.execute('''
+                INSERT OR REPLACE INTO stats_meta (key, value) VALUES ('last_attempt_id', ?)
+            ''', (self.last_attempt_id,))
+
+    def leaderboard(self):
+        with self._lock:
+            return [(user_id, -points) for points, user_id in self.top]
+
+    def question_stats(self, category):
+        with self._lock:
+            stats = self.categories.get(category)
+            return stats.percentages() if stats is not None else []
+
+
+def _generation(conn):
+    row = conn.execute("SELECT value FROM stats_meta WHERE key = 'generation'").fetchone()
+    return row['value'] if row is not None else 0
+
+
+_aggregates = None
+_aggregates_lock = threading.Lock()
+
+
+def get_aggregates():
+    global _aggregates
+    if _aggregates is None or _aggregates.pid != os.getpid():
+        with _aggregates_lock:
+            if _aggregates is None or _aggregates.pid != os.getpid():
+                aggregates = Aggregates()
+                conn = db.connect()
+                try:
+                    aggregates.load(conn)
+                finally:
+                    conn.close()
+                _aggregates = aggregates
+    return _aggregates
+
+
+def rebuild(conn):
+    # Сбрасываем контрольную точку и пересчитываем все попытки заново.
+    # Новое поколение заставляет работающие воркеры перечитать статистику
+    global _aggregates
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        generation = _generation(conn) + 1
+        conn.execute('DELETE FROM stats_meta')
+        conn.execute('DELETE FROM stats_users')
+        conn.execute('DELETE FROM stats_questions')
+        conn.execute(
+            "INSERT INTO stats_meta (key, value) VALUES ('generation', ?)", (generation,)
+        )
+    with _aggregates_lock:
+        aggregates = Aggregates()
+        aggregates.load(conn)
+        aggregates.dirty = {
+            (user_id, category)
+            for category, category_stats in aggregates.categories.items()
+            for user_id in category_stats.masks
+        }
+        aggregates.checkpoint(conn)
+        _aggregates = aggregates
+
+
+@atexit.register
+def shutdown():
+    if _aggregates is not None and _aggregates.pid == os.getpid():
+        conn = db.connect()
+        try:
+            _aggregates.refresh(conn)
+            _aggregates.checkpoint(conn)
+        finally:
+            conn.close()
@@ -0,0 +1,150 @@
+import csv
+import itertools
+import os
+import sqlite3
+from functools import partial
+from multiprocessing import Pool
+
+from werkzeug.security import generate_password_hash
+
+import db
+import hashing
+
+IMPORT_BATCH_SIZE = 5000
+SEARCH_LIMIT = 50
+MIN_PASSWORD_LENGTH = 4
+
+
+def create_tables(conn):
+    # Триграммный FTS5-индекс ищет подстроку в имени без полного просмотра users
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'users_fts'"
+    ).fetchone()
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            username, content='users', content_rowid='id', tokenize='trigram'
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, username) VALUES (new.id, new.username);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, username) VALUES ('delete', old.id, old.username);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF username ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, username) VALUES ('delete', old.id, old.username);
+            INSERT INTO users_fts (rowid, username) VALUES (new.id, new.username);
+        END
+    ''')
+    if exists is None:
+        conn.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+
+
+def _read_rows(f):
+    # Ожидаем CSV с колонками username,password; строка заголовка необязательна
+    for row in csv.reader(f):
+        if len(row) < 2:
+            continue
+        username, password = row[0].strip(), row[1].strip()
+        if username == 'username' and password == 'password':
+            continue
+        yield username, password
+
+
+def _hash_row(method, row):
+    username, password = row
+    if not username or len(password) < MIN_PASSWORD_LENGTH:
+        return None
+    return username, generate_password_hash(password, method=method)
+
+
+def import_csv(f, processes=None, batch_size=IMPORT_BATCH_SIZE, method=None):
+    # Хешируем пароли параллельно в нескольких процессах, а вставляем
+    # большими пачками: одна транзакция на batch_size пользователей
+    method = method or hashing.HASH_METHOD
+    result = {'imported': 0, 'skipped': 0, 'invalid': 0}
+    conn = db.connect()
+    try:
+        with Pool(processes) as pool:
+            hashed = pool.imap(partial(_hash_row, method), _read_rows(f), chunksize=64)
+            while True:
+                batch = list(itertools.islice(hashed, batch_size))
+                if not batch:
+                    break
+                rows = [row for row in batch if row is not None]
+                result['invalid'] += len(batch) - len(rows)
+                with conn:
+                    # rowcount не учитывает изменения, сделанные триггерами FTS
+                    inserted = conn.executemany(
+                        'INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)',
+                        rows
+                    ).rowcount
+                result['imported'] += inserted
+                result['skipped'] += len(rows) - inserted
+    finally:
+        conn.close()
+    return result
+
+
+def export_csv(f, batch_size=IMPORT_BATCH_SIZE):
+    # Выгружаем порциями, не держа всю таблицу в памяти; хеши паролей не выгружаем
+    writer = csv.writer(f)
+    writer.writerow(('id', 'username'))
+    conn = db.connect()
+    try:
+        cursor = conn.execute('SELECT id, username FROM users ORDER BY id')
+        exported = 0
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            writer.writerows(tuple(row) for row in rows)
+            exported += len(rows)
+    finally:
+        conn.close()
+    return exported
+
+
+def search(conn, query, limit=SEARCH_LIMIT):
+    query = query.strip()
+    if not query:
+        return []
+    # Сначала совпадения по началу имени — по уникальному индексу на username
+    rows = conn.execute('''
+        SELECT id, username FROM users
+        WHERE username >= ? AND username < ?
+        ORDER BY username LIMIT ?
+    ''', (query, query + '\U0010ffff', limit)).fetchall()
+    if len(rows) >= limit:
+        return rows
+    seen = {row['id'] for row in rows}
+    if len(query) >= 3:
+        # Триграммы работают для подстрок от трех символов
+        phrase = '"%s"' % query.replace('"', '""')
+        try:
+            more = conn.execute('''
+                SELECT rowid AS id, username FROM users_fts
+                WHERE users_fts MATCH ? LIMIT ?
+            ''', (phrase, limit + len(seen))).fetchall()
+        except sqlite3.OperationalError:
+            more = []
+    else:
+        pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        more = conn.execute('''
+            SELECT id, username FROM users
+            WHERE username LIKE ? ESCAPE '\\' LIMIT ?
+        ''', (pattern, limit + len(seen))).fetchall()
+    for row in more:
+        if row['id'] not in seen and len(rows) < limit:
+            rows.append(row)
+            seen.add(row['id'])
+    return rows
+
+
+def admins():
+    return {name.strip() for name in os.environ.get('ADMIN_USERS', '').split(',') if name.strip()}
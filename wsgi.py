@@ -1,4 +1,10 @@
-from app import app
+from app import app, init_db
+
+# Подготовка до fork: gunicorn с preload_app импортирует этот модуль один раз.
+# Банки вопросов уже загружены при импорте app
+init_db()
+for name in app.jinja_env.list_templates():
+    app.jinja_env.get_template(name)
 
 if __name__ == '__main__':
     app.run()